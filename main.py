@@ -1,17 +1,46 @@
+import io
+import json
 import os
-import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 from youtube_transcript_api import YouTubeTranscriptApi
 
 REPORT_FILE = "report.txt"
+CACHE_DIR = ".cache"
 
 RECENT_HOURS = 12
 SEARCH_HOURS = 48
 
+# videos.list의 id 파라미터 최대 개수
+VIDEOS_BATCH = 50
+
+# 디스크 캐시 유효시간(시간 단위)
+VIDEO_CACHE_HOURS = 6
+TRANSCRIPT_CACHE_HOURS = 24
+NO_TRANSCRIPT_CACHE_HOURS = 1
+# ETag는 서버가 변경 여부를 판단하므로 하루 1회 실행 간격보다 넉넉하게 보관
+PLAYLIST_CACHE_HOURS = 72
+
+# 채널별 처리는 네트워크 대기가 대부분이라 스레드로 동시에 돌린다
+MAX_WORKERS = 8
+
+# keep-alive 연결을 채널 간에 재사용(TLS 핸드셰이크는 호스트당 1회)
+# 풀 크기를 워커 수에 맞춰 동시 요청 시 연결이 버려지지 않게 함
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS))
+
+# youtube-transcript-api 1.x는 스레드 안전하지 않고 세션 헤더/쿠키를 바꾸므로
+# 자막용 세션은 스레드마다 따로 두고 SESSION은 Data API 전용으로 유지
+_transcript_local = threading.local()
+
 CHANNELS = {
     "Bloomberg": "UCIALMKvObZNtJ6AmdCLP7Lg",
     "Meet Kevin": "UCUvvj5lwue7PspotMDjk5UA",
@@ -21,15 +50,16 @@ CHANNELS = {
     "소수몽키": "UCC3yfxS5qC6PCwDzetUuEWg",
 }
 
-def kst_now_str() -> str:
-    return (datetime.now(timezone.utc) + timedelta(hours=9)).strftime("%Y-%m-%d %H:%M (KST)")
-
-def iso_utc(dt: datetime) -> str:
-    return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+def kst_str(dt: datetime) -> str:
+    return (dt.astimezone(timezone.utc) + timedelta(hours=9)).strftime("%Y-%m-%d %H:%M (KST)")
 
 def clean_text(s: str) -> str:
-    return re.sub(r"\s+", " ", (s or "")).strip()
+    # 인자 없는 str.split()은 \s+ 분리와 같고 strip까지 한 번에 처리
+    return " ".join(s.split()) if s else ""
 
+# 일반 업로드는 videoPublishedAt(목록)과 snippet.publishedAt(상세)이 같은 문자열이라
+# 한 실행 안에서 두 번째 파싱이 캐시 적중(프로세스 단위, 실행 간에는 유지 안 됨)
+@lru_cache(maxsize=512)
 def parse_dt(s: Optional[str]) -> Optional[datetime]:
     if not s:
         return None
@@ -38,38 +68,131 @@ def parse_dt(s: Optional[str]) -> Optional[datetime]:
     except Exception:
         return None
 
+# ---------- Disk cache ----------
+
+_cache_lock = threading.Lock()
+_caches: Dict[str, dict] = {}
+
+def _cache_path(name: str) -> str:
+    return os.path.join(CACHE_DIR, f"{name}.json")
+
+def _cache_load(name: str) -> dict:
+    with _cache_lock:
+        if name not in _caches:
+            try:
+                with open(_cache_path(name), "r", encoding="utf-8") as f:
+                    _caches[name] = json.load(f)
+            except Exception:
+                _caches[name] = {}
+        return _caches[name]
+
+def cache_get(name: str, key: str, ttl_hours: float) -> Optional[dict]:
+    entry = _cache_load(name).get(key)
+    if not entry or time.time() - entry.get("ts", 0) > ttl_hours * 3600:
+        return None
+    return entry
+
+def cache_put(name: str, key: str, **fields) -> None:
+    cache = _cache_load(name)
+    with _cache_lock:
+        cache[key] = {"ts": time.time(), **fields}
+
+def cache_save() -> None:
+    """
+    메모리 캐시를 CACHE_DIR에 기록.
+    가장 긴 TTL보다 오래된 항목은 버려서 파일이 계속 커지지 않게 함.
+    """
+    max_age = max(VIDEO_CACHE_HOURS, TRANSCRIPT_CACHE_HOURS, NO_TRANSCRIPT_CACHE_HOURS, PLAYLIST_CACHE_HOURS) * 3600
+    now = time.time()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with _cache_lock:
+        for name, cache in _caches.items():
+            fresh = {k: v for k, v in cache.items() if now - v.get("ts", 0) <= max_age}
+            # 중간에 끊겨도 깨진 JSON이 남지 않도록 임시 파일에 쓴 뒤 교체
+            path = _cache_path(name)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(fresh, f, ensure_ascii=False)
+            os.replace(tmp, path)
+
 # ---------- YouTube Data API ----------
 
-def youtube_search_latest(channel_id: str, published_after: datetime, api_key: str, max_results: int = 10) -> List[dict]:
-    url = "https://www.googleapis.com/youtube/v3/search"
+def api_error(endpoint: str, r: requests.Response) -> RuntimeError:
+    # 리포트에는 앞 300자만 남기므로 본문 전체를 디코딩하지 않고 앞부분만 변환
+    body = r.content[:1200].decode("utf-8", "replace")[:300]
+    return RuntimeError(f"YouTube API {endpoint} error {r.status_code}: {body}")
+
+def youtube_uploads_latest(channel_id: str, published_after: datetime, api_key: str, max_results: int = 10) -> List[str]:
+    """
+    채널 업로드 재생목록(UC... -> UU...)에서 최신 videoId 목록 조회.
+    search.list(100 unit) 대신 playlistItems.list(1 unit) 사용,
+    publishedAfter 필터는 videoPublishedAt 기준으로 클라이언트에서 적용.
+    직전 응답의 ETag로 If-None-Match 요청 -> 304면 캐시된 items 재사용(쿼터/본문 없음).
+    """
+    url = "https://www.googleapis.com/youtube/v3/playlistItems"
     params = {
-        "part": "snippet",
-        "channelId": channel_id,
-        "order": "date",
-        "type": "video",
+        "part": "contentDetails",
+        "playlistId": "UU" + channel_id[2:],
         "maxResults": max_results,
-        "publishedAfter": iso_utc(published_after),
         "key": api_key,
     }
-    r = requests.get(url, params=params, timeout=30)
-    if r.status_code != 200:
-        raise RuntimeError(f"YouTube API search error {r.status_code}: {r.text[:300]}")
-    return r.json().get("items", [])
+    cached = cache_get("playlists", channel_id, PLAYLIST_CACHE_HOURS)
+    headers = {"If-None-Match": cached["etag"]} if cached else None
+    r = SESSION.get(url, params=params, headers=headers, timeout=30)
+    if r.status_code == 304 and cached:
+        etag, items = cached["etag"], cached["items"]
+    elif r.status_code == 200:
+        data = r.json()
+        etag, items = data.get("etag") or r.headers.get("ETag"), data.get("items", [])
+    else:
+        raise api_error("playlistItems", r)
+    if etag:
+        cache_put("playlists", channel_id, etag=etag, items=items)
+
+    # 예약 스트림/프리미어는 순서가 어긋날 수 있어 항목마다 기간 필터 적용
+    video_ids = []
+    for it in items:
+        cd = it.get("contentDetails", {})
+        published = parse_dt(cd.get("videoPublishedAt"))
+        if published and published < published_after:
+            continue
+        if cd.get("videoId"):
+            video_ids.append(cd["videoId"])
+    return video_ids
 
 def youtube_videos_details(video_ids: List[str], api_key: str) -> Dict[str, dict]:
-    if not video_ids:
-        return {}
+    """
+    VIDEO_CACHE_HOURS 안에 받아둔 항목은 캐시에서, 나머지만 API로 조회.
+    id는 요청당 최대 VIDEOS_BATCH개라 그 단위로 나눠 호출.
+    진행중/예정 라이브는 상태가 곧 바뀌므로 캐시하지 않음.
+    """
+    details: Dict[str, dict] = {}
+    missing: List[str] = []
+    for vid in video_ids:
+        entry = cache_get("videos", vid, VIDEO_CACHE_HOURS)
+        if entry:
+            details[vid] = entry["item"]
+        else:
+            missing.append(vid)
+    if not missing:
+        return details
+
     url = "https://www.googleapis.com/youtube/v3/videos"
-    params = {
-        "part": "snippet,liveStreamingDetails,contentDetails",
-        "id": ",".join(video_ids),
-        "key": api_key,
-    }
-    r = requests.get(url, params=params, timeout=30)
-    if r.status_code != 200:
-        raise RuntimeError(f"YouTube API videos error {r.status_code}: {r.text[:300]}")
-    items = r.json().get("items", [])
-    return {it["id"]: it for it in items}
+    for i in range(0, len(missing), VIDEOS_BATCH):
+        params = {
+            "part": "snippet,liveStreamingDetails,contentDetails",
+            "id": ",".join(missing[i:i + VIDEOS_BATCH]),
+            "key": api_key,
+        }
+        r = SESSION.get(url, params=params, timeout=30)
+        if r.status_code != 200:
+            raise api_error("videos", r)
+        for it in r.json().get("items", []):
+            details[it["id"]] = it
+            lsd = it.get("liveStreamingDetails")
+            if lsd is None or "actualEndTime" in lsd:
+                cache_put("videos", it["id"], item=it)
+    return details
 
 def is_live_ongoing(video_detail: dict) -> bool:
     lsd = video_detail.get("liveStreamingDetails") or {}
@@ -90,34 +213,78 @@ def effective_time_for_filter(video_detail: dict) -> Optional[datetime]:
 
 # ---------- Transcript (버전 차이 안전) ----------
 
+def transcript_session() -> requests.Session:
+    session = getattr(_transcript_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS))
+        _transcript_local.session = session
+    return session
+
+def _part_text(p) -> str:
+    # 1.x는 FetchedTranscriptSnippet 객체, 이전 버전은 dict
+    if isinstance(p, dict):
+        return p.get("text", "")
+    return getattr(p, "text", "") or ""
+
+# 자막이 "확실히 없음"을 뜻하는 예외(버전별 import 경로 차이를 피해 이름으로 판별)
+_NO_CAPTION_ERRORS = ("TranscriptsDisabled", "NoTranscriptFound")
+
+def _is_no_caption_error(e: Exception) -> bool:
+    return type(e).__name__ in _NO_CAPTION_ERRORS
+
 def fetch_transcript_text(video_id: str, prefer_langs=("ko", "en")) -> Optional[str]:
     """
-    자막 있으면 텍스트, 없으면 None.
-    (NoTranscriptFound 같은 예외 생성/시그니처 차이를 완전히 회피)
+    자막 있으면 텍스트, 자막이 확실히 없으면 None.
+    네트워크 오류/요청 차단 등 그 외 실패는 예외를 그대로 올림(캐시 판단용).
+    1.x 인스턴스 API는 스레드별 세션을 넘겨 같은 스레드 안에서 연결 재사용.
     """
     try:
-        if hasattr(YouTubeTranscriptApi, "list_transcripts"):
+        transcripts = None
+        if hasattr(YouTubeTranscriptApi, "list"):
+            transcripts = YouTubeTranscriptApi(http_client=transcript_session()).list(video_id)
+        elif hasattr(YouTubeTranscriptApi, "list_transcripts"):
             transcripts = YouTubeTranscriptApi.list_transcripts(video_id)
+
+        if transcripts is not None:
+            error = None
             for lang in prefer_langs:
                 try:
                     t = transcripts.find_transcript([lang])
                     parts = t.fetch()
-                    text = clean_text(" ".join(p.get("text", "") for p in parts))
+                    text = clean_text(" ".join(_part_text(p) for p in parts))
                     return text if text else None
-                except Exception:
-                    pass
+                except Exception as e:
+                    if not _is_no_caption_error(e):
+                        error = e
+            if error:
+                raise error
             return None
 
-        for lang in prefer_langs:
-            try:
-                parts = YouTubeTranscriptApi.get_transcript(video_id, languages=[lang])
-                text = clean_text(" ".join(p.get("text", "") for p in parts))
-                return text if text else None
-            except Exception:
-                pass
-        return None
+        # languages 우선순위를 한 번에 넘기면 자막 목록 조회가 1회로 끝남
+        parts = YouTubeTranscriptApi.get_transcript(video_id, languages=list(prefer_langs))
+        text = clean_text(" ".join(_part_text(p) for p in parts))
+        return text if text else None
+    except Exception as e:
+        if _is_no_caption_error(e):
+            return None
+        raise
+
+def fetch_transcript_text_cached(video_id: str) -> Optional[str]:
+    """
+    fetch_transcript_text 결과를 video_id 기준으로 캐시.
+    자막 없음(None)은 나중에 자막이 붙을 수 있어 NO_TRANSCRIPT_CACHE_HOURS만 유지.
+    차단/네트워크 오류는 None으로 처리하되 캐시하지 않음(재실행 시 다시 시도).
+    """
+    entry = cache_get("transcripts", video_id, TRANSCRIPT_CACHE_HOURS)
+    if entry and (entry["text"] or time.time() - entry["ts"] <= NO_TRANSCRIPT_CACHE_HOURS * 3600):
+        return entry["text"]
+    try:
+        text = fetch_transcript_text(video_id)
     except Exception:
         return None
+    cache_put("transcripts", video_id, text=text)
+    return text
 
 # ---------- Result ----------
 
@@ -134,25 +301,22 @@ class ChannelResult:
     transcript_chars: int = 0
     debug_candidates: List[str] = None
 
-def process_channel(name: str, channel_id: str, api_key: str) -> ChannelResult:
-    now = datetime.now(timezone.utc)
-    published_after = now - timedelta(hours=SEARCH_HOURS)
-
+def process_channel(name: str, uploads: Future, details_future: Future, now: datetime) -> ChannelResult:
+    """
+    uploads: 이 채널의 youtube_uploads_latest 결과
+    details_future: 전 채널 후보를 한 번에 조회한 youtube_videos_details 결과
+    (조회 중 난 예외는 .result()에서 다시 발생해 API_ERROR로 기록됨)
+    """
     try:
-        items = youtube_search_latest(channel_id, published_after, api_key, max_results=10)
-        if not items:
+        video_ids = uploads.result()
+        if not video_ids:
             return ChannelResult(channel=name, status="NO_VIDEO", note=f"최근 {SEARCH_HOURS}시간 검색 결과 없음", debug_candidates=[])
 
-        video_ids = []
-        for it in items:
-            vid = it.get("id", {}).get("videoId")
-            if vid:
-                video_ids.append(vid)
-
-        details = youtube_videos_details(video_ids, api_key)
+        details = details_future.result()
 
-        # 후보 디버그 목록 만들기
+        # 후보 디버그 목록 만들기(진행중 여부/기준 시간은 여기서 한 번만 계산해 선택에도 재사용)
         debug = []
+        candidates: List[Tuple[str, bool, Optional[datetime]]] = []
         for vid in video_ids:
             d = details.get(vid)
             if not d:
@@ -164,23 +328,15 @@ def process_channel(name: str, channel_id: str, api_key: str) -> ChannelResult:
             lsd = d.get("liveStreamingDetails") or {}
             endt = lsd.get("actualEndTime")
             ongoing = is_live_ongoing(d)
+            candidates.append((vid, ongoing, eff))
             debug.append(f"{vid} | ongoing={ongoing} | publishedAt={pub} | actualEndTime={endt} | effective={eff} | {title[:60]}")
 
         # 선택 로직: 진행중 라이브 제외 + effective_time 기준 12시간
-        chosen_id = None
-        for vid in video_ids:
-            d = details.get(vid)
-            if not d:
-                continue
-            if is_live_ongoing(d):
-                continue
-            eff = effective_time_for_filter(d)
-            if not eff:
-                continue
-            if (now - eff) > timedelta(hours=RECENT_HOURS):
-                continue
-            chosen_id = vid
-            break
+        recent_cutoff = now - timedelta(hours=RECENT_HOURS)
+        chosen_id = next(
+            (vid for vid, ongoing, eff in candidates if not ongoing and eff and eff >= recent_cutoff),
+            None,
+        )
 
         if not chosen_id:
             return ChannelResult(
@@ -198,7 +354,7 @@ def process_channel(name: str, channel_id: str, api_key: str) -> ChannelResult:
         endt = lsd.get("actualEndTime")
         url = f"https://www.youtube.com/watch?v={chosen_id}"
 
-        text = fetch_transcript_text(chosen_id)
+        text = fetch_transcript_text_cached(chosen_id)
         if text:
             return ChannelResult(
                 channel=name,
@@ -228,56 +384,96 @@ def process_channel(name: str, channel_id: str, api_key: str) -> ChannelResult:
     except Exception as e:
         return ChannelResult(channel=name, status="API_ERROR", note=str(e)[:300], debug_candidates=[])
 
-def main():
-    api_key = os.getenv("YOUTUBE_API_KEY", "").strip()
-    if not api_key:
-        raise RuntimeError("YOUTUBE_API_KEY가 설정되지 않았습니다(GitHub Secrets 확인).")
-
-    run_id = os.getenv("GITHUB_RUN_ID", "LOCAL")
-    run_num = os.getenv("GITHUB_RUN_NUMBER", "0")
-
-    results: List[ChannelResult] = []
-    for name, cid in CHANNELS.items():
-        results.append(process_channel(name, cid, api_key))
-
-    lines: List[str] = []
-    lines.append("[미국 주식 시황 리포트 - 안정형]")
-    lines.append(f"생성 시각: {kst_now_str()}")
-    lines.append(f"Run: {run_num} (id={run_id})")
-    lines.append(f"검색: 최근 {SEARCH_HOURS}시간 / 최종 선택: 최근 {RECENT_HOURS}시간")
-    lines.append("필터 시간 기준: 종료된 라이브는 actualEndTime, 그 외는 publishedAt")
-    lines.append("진행중 라이브는 제외")
-    lines.append("")
-
-    lines.append("■ 채널별 결과")
+# ---------- Report ----------
+
+REPORT_HEADER = (
+    "[미국 주식 시황 리포트 - 안정형]\n"
+    "생성 시각: {generated}\n"
+    "Run: {run_num} (id={run_id})\n"
+    "검색: 최근 {search_hours}시간 / 최종 선택: 최근 {recent_hours}시간\n"
+    "필터 시간 기준: 종료된 라이브는 actualEndTime, 그 외는 publishedAt\n"
+    "진행중 라이브는 제외\n"
+    "\n"
+    "■ 채널별 결과\n"
+)
+
+CHANNEL_HEADER = "- {channel}\n  상태: {status}\n"
+
+def render_report(results: List[ChannelResult], now: datetime, run_num: str, run_id: str) -> str:
+    buf = io.StringIO()
+    w = buf.write
+    w(REPORT_HEADER.format(
+        generated=kst_str(now),
+        run_num=run_num,
+        run_id=run_id,
+        search_hours=SEARCH_HOURS,
+        recent_hours=RECENT_HOURS,
+    ))
     for r in results:
-        lines.append(f"- {r.channel}")
-        lines.append(f"  상태: {r.status}")
+        w(CHANNEL_HEADER.format(channel=r.channel, status=r.status))
         if r.title:
-            lines.append(f"  제목: {r.title}")
+            w(f"  제목: {r.title}\n")
         if r.url:
-            lines.append(f"  URL: {r.url}")
+            w(f"  URL: {r.url}\n")
         if r.published_at:
-            lines.append(f"  publishedAt: {r.published_at}")
+            w(f"  publishedAt: {r.published_at}\n")
         if r.end_time:
-            lines.append(f"  actualEndTime: {r.end_time}")
+            w(f"  actualEndTime: {r.end_time}\n")
         if r.status == "SUCCESS":
-            lines.append(f"  텍스트화: 성공(문자수 {r.transcript_chars})")
+            w(f"  텍스트화: 성공(문자수 {r.transcript_chars})\n")
         if r.note:
-            lines.append(f"  비고: {r.note}")
+            w(f"  비고: {r.note}\n")
 
         # NO_VIDEO/NO_TRANSCRIPT일 때 왜 그런지 후보 10개를 바로 보여줌
         if r.status in ("NO_VIDEO", "NO_TRANSCRIPT") and r.debug_candidates:
-            lines.append("  후보(최신 10개) 디버그:")
+            w("  후보(최신 10개) 디버그:\n")
             for s in r.debug_candidates[:10]:
-                lines.append(f"   - {s}")
+                w(f"   - {s}\n")
 
-        lines.append("")
+        w("\n")
+
+    return buf.getvalue().rstrip() + "\n"
+
+def main():
+    api_key = os.getenv("YOUTUBE_API_KEY", "").strip()
+    if not api_key:
+        raise RuntimeError("YOUTUBE_API_KEY가 설정되지 않았습니다(GitHub Secrets 확인).")
+
+    run_id = os.getenv("GITHUB_RUN_ID", "LOCAL")
+    run_num = os.getenv("GITHUB_RUN_NUMBER", "0")
+
+    # 모든 채널이 같은 기준 시각으로 기간 필터를 적용하도록 한 번만 계산
+    now = datetime.now(timezone.utc)
+    published_after = now - timedelta(hours=SEARCH_HOURS)
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(CHANNELS))) as ex:
+        # 1) 채널별 업로드 목록(같은 UC ID는 한 번만)
+        uploads: Dict[str, Future] = {
+            cid: ex.submit(youtube_uploads_latest, cid, published_after, api_key)
+            for cid in dict.fromkeys(CHANNELS.values())
+        }
+
+        # 2) 전 채널 후보를 모아 videos.list를 한 번에(VIDEOS_BATCH 단위)
+        all_ids = list(dict.fromkeys(
+            vid for fut in uploads.values() if fut.exception() is None for vid in fut.result()
+        ))
+        details = ex.submit(youtube_videos_details, all_ids, api_key)
+
+        # 3) 채널별 선택 + 자막(채널 순서는 ex.map이 그대로 유지)
+        results: List[ChannelResult] = list(
+            ex.map(lambda kv: process_channel(kv[0], uploads[kv[1]], details, now), CHANNELS.items())
+        )
 
     with open(REPORT_FILE, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines).rstrip() + "\n")
+        f.write(render_report(results, now, run_num, run_id))
 
     print("report.txt 생성 완료")
 
+    # 캐시는 최적화일 뿐이므로 저장 실패가 실행을 실패시키지 않게 함
+    try:
+        cache_save()
+    except Exception as e:
+        print(f"캐시 저장 실패(무시): {e}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file